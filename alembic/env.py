@@ -4,6 +4,7 @@ from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 
 from alembic import context
+from app.db.models.dataset_generation import DatasetGeneration  # noqa: F401
 from app.db.models.tweets import Tweet
 
 # this is the Alembic Config object, which provides
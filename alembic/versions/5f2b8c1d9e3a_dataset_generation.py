@@ -0,0 +1,39 @@
+"""dataset_generation
+
+Revision ID: 5f2b8c1d9e3a
+Revises: a6a3245a2af9
+Create Date: 2026-10-19 09:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5f2b8c1d9e3a"
+down_revision: Union[str, None] = "a6a3245a2af9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "dataset_generation",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("generation", sa.Integer(), nullable=False),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    # The table always holds exactly one row, which ingest updates in place.
+    op.execute("INSERT INTO dataset_generation (id, generation) VALUES (1, 1)")
+
+
+def downgrade() -> None:
+    op.drop_table("dataset_generation")
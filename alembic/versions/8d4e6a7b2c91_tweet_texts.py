@@ -0,0 +1,70 @@
+"""tweet_texts
+
+Moves the wide text columns of tweets into a side table, so that the
+aggregate scans of the analytics endpoints only read narrow rows.
+
+The text columns can be stored with a specific TOAST compression method
+(Postgres 14+), e.g. `alembic -x text_compression=lz4 upgrade head`.
+
+Dropping the columns doesn't rewrite the existing rows of tweets, their space
+is only reclaimed once the table is rewritten (e.g. `VACUUM FULL tweets`).
+
+Revision ID: 8d4e6a7b2c91
+Revises: 5f2b8c1d9e3a
+Create Date: 2026-10-19 14:03:27.551930
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8d4e6a7b2c91"
+down_revision: Union[str, None] = "5f2b8c1d9e3a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TEXT_COLUMNS = ("full_text", "text", "clean_text")
+TEXT_COMPRESSION_METHODS = ("pglz", "lz4")
+
+
+def upgrade() -> None:
+    op.create_table(
+        "tweet_texts",
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("full_text", sa.String(), nullable=True),
+        sa.Column("text", sa.String(), nullable=True),
+        sa.Column("clean_text", sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(["id"], ["tweets.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+    compression = context.get_x_argument(as_dictionary=True).get("text_compression")
+    if compression:
+        if compression not in TEXT_COMPRESSION_METHODS:
+            raise ValueError(f"Unsupported text_compression: {compression}")
+        for column in TEXT_COLUMNS:
+            op.execute(
+                f"ALTER TABLE tweet_texts ALTER COLUMN {column} "
+                f"SET COMPRESSION {compression}"
+            )
+
+    op.execute(
+        "INSERT INTO tweet_texts (id, full_text, text, clean_text) "
+        "SELECT id, full_text, text, clean_text FROM tweets"
+    )
+    for column in TEXT_COLUMNS:
+        op.drop_column("tweets", column)
+
+
+def downgrade() -> None:
+    for column in TEXT_COLUMNS:
+        op.add_column("tweets", sa.Column(column, sa.String(), nullable=True))
+    op.execute(
+        "UPDATE tweets SET full_text = tweet_texts.full_text, "
+        "text = tweet_texts.text, clean_text = tweet_texts.clean_text "
+        "FROM tweet_texts WHERE tweet_texts.id = tweets.id"
+    )
+    op.drop_table("tweet_texts")
@@ -0,0 +1,191 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.db.database import SessionLocal, read_engine_balancer
+
+# Postgres error code of a statement cancelled by statement_timeout
+QUERY_CANCELED = "57014"
+
+# Optional budget for the planner's estimated cost of the wide aggregations.
+# Requests whose query is estimated above it are rejected, unset disables it.
+MAX_QUERY_COST = (
+    float(os.environ["NCRI_MAX_QUERY_COST"])
+    if os.environ.get("NCRI_MAX_QUERY_COST")
+    else None
+)
+
+
+@dataclass(frozen=True)
+class AdmissionPolicy:
+    # Requests running at the same time
+    max_concurrency: int
+    # Requests allowed to wait for a slot, the rest are shed right away
+    max_queue: int
+    # Seconds a request waits for a slot before being shed
+    queue_timeout: float = 10.0
+    statement_timeout_ms: Optional[int] = None
+    max_cost: Optional[float] = None
+
+
+# The concurrency limits take 12 of the 15 connections of a worker's pool
+# (5 connections + 10 overflow). The rest is left to the validator lookups of
+# conditional_cache and to the background jobs, which share the pool.
+ADMISSION_POLICIES = {
+    "analytics.key_user_stats": AdmissionPolicy(
+        max_concurrency=2, max_queue=10, statement_timeout_ms=15000
+    ),
+    "analytics.tweet_stats": AdmissionPolicy(
+        max_concurrency=2, max_queue=30, statement_timeout_ms=5000
+    ),
+    "data_filtering.filtered_data": AdmissionPolicy(
+        max_concurrency=2, max_queue=30, statement_timeout_ms=5000
+    ),
+    "visualization_data.tweet_trends": AdmissionPolicy(
+        max_concurrency=2,
+        max_queue=10,
+        statement_timeout_ms=15000,
+        max_cost=MAX_QUERY_COST,
+    ),
+    "visualization_data.tweet_distribution": AdmissionPolicy(
+        max_concurrency=2,
+        max_queue=10,
+        statement_timeout_ms=15000,
+        max_cost=MAX_QUERY_COST,
+    ),
+    "visualization_data.tweet_heatmap": AdmissionPolicy(
+        max_concurrency=2, max_queue=30, statement_timeout_ms=5000
+    ),
+}
+
+
+def _overloaded(route: str) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=f"Too many concurrent {route} requests, try again later",
+        headers={"Retry-After": "1"},
+    )
+
+
+class Bulkhead:
+    """
+    Bounds the number of requests of a route running at the same time, with
+    a bounded queue of requests waiting for a slot.
+    """
+
+    def __init__(self, route: str, policy: AdmissionPolicy):
+        self.route = route
+        self.policy = policy
+        self.waiting = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self):
+        # Created here so that it belongs to the worker's event loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.policy.max_concurrency)
+        if self._semaphore.locked() and self.waiting >= self.policy.max_queue:
+            raise _overloaded(self.route)
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(
+                self._semaphore.acquire(), timeout=self.policy.queue_timeout
+            )
+        except asyncio.TimeoutError:
+            raise _overloaded(self.route)
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        self._semaphore.release()
+
+
+class Admission:
+    """
+    Runs the queries of a request once admitted through its route's bulkhead.
+    """
+
+    def __init__(self, bulkhead: Bulkhead):
+        self.bulkhead = bulkhead
+
+    async def run(self, fn: Callable[[Session], Any]) -> Any:
+        """
+        Run the blocking `fn` in the threadpool once a slot is free, with a
+        read session under the route's statement timeout.
+
+        Called from within `single_flight.do_async`, so that only the request
+        running a query takes a slot, not the ones waiting for its result.
+        The session is opened here rather than taken from that request, as
+        the query outlives it when it goes away before the others.
+        """
+        await self.bulkhead.acquire()
+        try:
+            return await run_in_threadpool(self._run, fn)
+        finally:
+            self.bulkhead.release()
+
+    def _run(self, fn: Callable[[Session], Any]) -> Any:
+        with SessionLocal(bind=read_engine_balancer.choose()) as db:
+            db.info["statement_timeout_ms"] = self.bulkhead.policy.statement_timeout_ms
+            return fn(db)
+
+
+def admission(route: str):
+    """
+    Dependency returning the `Admission` to run the queries of `route` with.
+    """
+    bulkhead = Bulkhead(route, ADMISSION_POLICIES[route])
+
+    async def admit() -> Admission:
+        return Admission(bulkhead)
+
+    return admit
+
+
+@event.listens_for(Session, "after_begin")
+def _set_statement_timeout(session, transaction, connection):
+    statement_timeout_ms = session.info.get("statement_timeout_ms")
+    if statement_timeout_ms:
+        connection.exec_driver_sql(
+            f"SET LOCAL statement_timeout = {int(statement_timeout_ms)}"
+        )
+
+
+def check_query_cost(db: Session, statement, params: dict, max_cost: Optional[float]):
+    """
+    Reject `statement` when the planner estimates its cost above `max_cost`.
+    """
+    if max_cost is None:
+        return
+    connection = db.connection()
+    compiled = statement.compile(dialect=connection.dialect)
+    plan = connection.exec_driver_sql(
+        "EXPLAIN (FORMAT JSON) " + str(compiled), compiled.construct_params(params)
+    ).scalar()
+    cost = plan[0]["Plan"]["Total Cost"]
+    if cost > max_cost:
+        raise HTTPException(
+            status_code=422,
+            detail="Query too expensive, narrow down the request parameters",
+        )
+
+
+async def _statement_timeout_handler(request: Request, exc: OperationalError):
+    if getattr(exc.orig, "pgcode", None) != QUERY_CANCELED:
+        raise exc
+    return JSONResponse(
+        {"detail": "Query took too long, narrow down the request parameters"},
+        status_code=503,
+    )
+
+
+def add_admission_exception_handler(app: FastAPI):
+    app.add_exception_handler(OperationalError, _statement_timeout_handler)
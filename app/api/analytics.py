@@ -2,12 +2,14 @@ from datetime import datetime, timedelta
 from functools import lru_cache
 from typing import Optional
 
-from fastapi import APIRouter, Depends, Query, Request
-from sqlalchemy import func, or_
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import DateTime, bindparam, func, or_, select
 from sqlalchemy.orm import Session
 
-from app.db.database import get_db
+from app.admission import Admission, admission
+from app.coalescing import make_key, single_flight
 from app.db.models.tweets import Tweet
+from app.http_cache import conditional_cache, daily_conditional_cache
 from app.limiter import limiter
 from app.models.request.data_filtering import HATEFUL, THREATENING
 
@@ -19,14 +21,15 @@ analytics = APIRouter(
 )
 
 
-@analytics.get("/twitter/users/stats")
-@limiter.limit("5/minute")
-@lru_cache(maxsize=None)
+@analytics.get(
+    "/twitter/users/stats",
+    dependencies=[Depends(conditional_cache), Depends(limiter.limit("5/minute"))],
+)
 async def get_key_user_stats(
     request: Request,
     page: int = Query(default=1, ge=1, description="Page number"),
     page_size: int = Query(default=10, ge=1, le=100, description="Page size"),
-    db: Session = Depends(get_db),
+    admitted: Admission = Depends(admission("analytics.key_user_stats")),
 ):
     """
     Description: This endpoint retrieves statistics about key users in the Twitter dataset, including the count of tweets posted by each user. The results are sorted in descending order based on the tweet count.
@@ -39,31 +42,19 @@ async def get_key_user_stats(
     - total_count: Total count of key users in the dataset.
     - items: A list containing information about key users, including their username (author) and the count of tweets posted by each user.
     """
-    # Calculate offset based on page number and page size
-    offset = (page - 1) * page_size
-
-    # Query for total count of key users
-    total_count_query = db.query(func.count(func.distinct(Tweet.author)))
-    total_count = total_count_query.scalar()
-
-    # Query for key users with pagination
-    query = (
-        db.query(Tweet.author, func.count().label("tweet_count"))
-        .group_by(Tweet.author)
-        .order_by(func.count().desc())
-        .limit(page_size)
-        .offset(offset)
+    key = make_key("analytics.key_user_stats", page=page, page_size=page_size)
+    return await single_flight.do_async(
+        key, lambda: admitted.run(lambda db: fetch_key_user_stats(db, page, page_size))
     )
 
-    # Execute the query and convert results to a list of dictionaries
-    result = [{"author": row.author, "tweet_count": row.tweet_count} for row in query]
-
-    return {"total_count": total_count, "items": result}
-
 
-@analytics.get("/twitter/stats")
-@limiter.limit("5/minute")
-@lru_cache(maxsize=None)
+@analytics.get(
+    "/twitter/stats",
+    dependencies=[
+        Depends(daily_conditional_cache),
+        Depends(limiter.limit("5/minute")),
+    ],
+)
 async def get_specific_tweet_stats(
     request: Request,
     start_date: Optional[datetime] = Query(default=None, description="Start date"),
@@ -71,7 +62,7 @@ async def get_specific_tweet_stats(
     page: int = Query(default=1, ge=1, description="Page number"),
     page_size: int = Query(default=10, ge=1, le=100, description="Page size"),
     criteria: Optional[str] = None,
-    db: Session = Depends(get_db),
+    admitted: Admission = Depends(admission("analytics.tweet_stats")),
 ):
     """
     Description: This endpoint retrieves specific Twitter statistics based on the set time interval and optional criteria. By default, it returns statistics for the past week, but users can specify custom start and end dates to retrieve data for any time range. Additionally, users can filter the data based on specific criteria such as threatening or hateful tweets.
@@ -88,6 +79,9 @@ async def get_specific_tweet_stats(
     Response:
     - A list of dictionaries containing the date and tweet count for each day within the specified time interval.
     """
+    if criteria and criteria not in (THREATENING, HATEFUL):
+        raise HTTPException(status_code=400, detail="Invalid criteria")
+
     # Default end date is today
     if not end_date:
         end_date = datetime.now().date()
@@ -95,6 +89,83 @@ async def get_specific_tweet_stats(
     if start_date is None:
         start_date = end_date - timedelta(days=7)
 
+    key = make_key(
+        "analytics.tweet_stats",
+        start_date=start_date,
+        end_date=end_date,
+        page=page,
+        page_size=page_size,
+        criteria=criteria,
+    )
+    return await single_flight.do_async(
+        key,
+        lambda: admitted.run(
+            lambda db: fetch_tweet_stats(
+                db, start_date, end_date, page, page_size, criteria
+            )
+        ),
+    )
+
+
+def fetch_key_user_stats(db: Session, page: int, page_size: int):
+    # Calculate offset based on page number and page size
+    offset = (page - 1) * page_size
+
+    total_count_statement, key_users_statement = _key_user_statements()
+
+    # Query for total count of key users
+    total_count = db.execute(total_count_statement).scalar()
+
+    # Query for key users with pagination
+    rows = db.execute(key_users_statement, {"limit": page_size, "offset": offset})
+
+    # Execute the query and convert results to a list of dictionaries
+    result = [{"author": row.author, "tweet_count": row.tweet_count} for row in rows]
+
+    return {"total_count": total_count, "items": result}
+
+
+def fetch_tweet_stats(
+    db: Session,
+    start_date: datetime,
+    end_date: datetime,
+    page: int,
+    page_size: int,
+    criteria: Optional[str] = None,
+):
+    offset = (page - 1) * page_size
+    rows = db.execute(
+        _tweet_stats_statement(criteria or None),
+        {
+            "start_date": start_date,
+            "end_date": end_date,
+            "limit": page_size,
+            "offset": offset,
+        },
+    )
+
+    # Execute the query and convert results to a list of dictionaries
+    result = [{"date": row.date, "tweet_count": row.tweet_count} for row in rows]
+    return result
+
+
+# Takes no filter, built once with the page bound at execution time.
+@lru_cache(maxsize=None)
+def _key_user_statements():
+    total_count_statement = select(func.count(func.distinct(Tweet.author)))
+    key_users_statement = (
+        select(Tweet.author, func.count().label("tweet_count"))
+        .group_by(Tweet.author)
+        .order_by(func.count().desc())
+        .limit(bindparam("limit"))
+        .offset(bindparam("offset"))
+    )
+    return total_count_statement, key_users_statement
+
+
+# Built once per criteria, the dates and page are bound at execution time.
+@lru_cache(maxsize=None)
+def _tweet_stats_statement(criteria: Optional[str]):
     # NOTE: these filters could be moved out.
     # They're used in data_filtering as well.
     threatening_filter = or_(
@@ -105,28 +176,22 @@ async def get_specific_tweet_stats(
         Tweet.hateful == "Medium",
         Tweet.hateful == "High",
     )
-    offset = (page - 1) * page_size
 
-    # Define the SQLAlchemy query
-    query = (
-        db.query(
-            func.date(Tweet.created_at).label("date"),
-            func.count().label("tweet_count"),
-        )
-        .filter(Tweet.created_at >= start_date, Tweet.created_at <= end_date)
-        .group_by(func.date(Tweet.created_at))
-        .order_by(func.date(Tweet.created_at))
-        .limit(page_size)
-        .offset(offset)
+    statement = select(
+        func.date(Tweet.created_at).label("date"),
+        func.count().label("tweet_count"),
+    ).where(
+        Tweet.created_at >= bindparam("start_date", type_=DateTime),
+        Tweet.created_at <= bindparam("end_date", type_=DateTime),
     )
-    if criteria:
-        if criteria == THREATENING:
-            query.filter(threatening_filter)
-        elif criteria == HATEFUL:
-            query.filter(hateful_filter)
-        else:
-            raise NotImplementedError
+    if criteria == THREATENING:
+        statement = statement.where(threatening_filter)
+    elif criteria == HATEFUL:
+        statement = statement.where(hateful_filter)
 
-    # Execute the query and convert results to a list of dictionaries
-    result = [{"date": row.date, "tweet_count": row.tweet_count} for row in query]
-    return result
+    return (
+        statement.group_by(func.date(Tweet.created_at))
+        .order_by(func.date(Tweet.created_at))
+        .limit(bindparam("limit"))
+        .offset(bindparam("offset"))
+    )
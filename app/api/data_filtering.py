@@ -1,11 +1,13 @@
 from functools import lru_cache
+from typing import Optional
 
 from fastapi import APIRouter, Depends, Query, Request
-from sqlalchemy import and_, or_
+from sqlalchemy import Integer, and_, bindparam, func, or_, select
 from sqlalchemy.orm import Session
 
-from app.db.database import get_db
-from app.db.models.tweets import Tweet
+from app.admission import Admission, admission
+from app.coalescing import make_key, single_flight
+from app.db.models.tweets import Tweet, TweetText
 from app.limiter import limiter
 from app.models.request.data_filtering import (
     HATEFUL,
@@ -23,21 +25,21 @@ data_filtering = APIRouter(
 )
 
 
-@data_filtering.post("/twitter/")
-@limiter.limit("5/minute")
-@lru_cache(maxsize=None)
+@data_filtering.post(
+    "/twitter/", dependencies=[Depends(limiter.limit("5/minute"))]
+)
 async def get_filtered_data(
     request: Request,
     data_filtering_params: DataFilteringParams,
     page: int = Query(default=1, ge=1, description="Page number"),
     page_size: int = Query(default=10, ge=1, le=100, description="Page size"),
-    db: Session = Depends(get_db),
+    admitted: Admission = Depends(admission("data_filtering.filtered_data")),
 ):
     """
     Description: This endpoint retrieves filtered data from the Twitter dataset based on the provided filtering parameters. Users can filter the data based on day, month, and year, as well as the content type of the tweets, including threatening, non-threatening, neutral, or hateful content.
 
     Parameters:
-    - data_filtering_params: Object containing filtering parameters including day, month, year, and content_type_validated.
+    - data_filtering_params: Object containing filtering parameters including day, month, year, content_type_validated, and include_text (whether to return the text of the tweets).
     - page: Page number for pagination.
     - page_size: Number of results per page. Must be between 1 and 100, inclusive.
 
@@ -46,15 +48,78 @@ async def get_filtered_data(
     - total_tweets: Total count of tweets matching the filtering criteria.
     """
 
-    query = db.query(Tweet)
+    key = make_key(
+        "data_filtering.filtered_data",
+        page=page,
+        page_size=page_size,
+        **data_filtering_params.model_dump(),
+    )
+    return await single_flight.do_async(
+        key,
+        lambda: admitted.run(
+            lambda db: fetch_filtered_data(db, data_filtering_params, page, page_size)
+        ),
+    )
+
+
+def fetch_filtered_data(
+    db: Session,
+    data_filtering_params: DataFilteringParams,
+    page: int,
+    page_size: int,
+):
+    content_type = data_filtering_params.content_type_validated
+    count_statement, page_statement = _filtered_data_statements(
+        bool(data_filtering_params.day),
+        bool(data_filtering_params.month),
+        bool(data_filtering_params.year),
+        content_type or None,
+        data_filtering_params.include_text,
+    )
+    params = {
+        "day": data_filtering_params.day,
+        "month": data_filtering_params.month,
+        "year": data_filtering_params.year,
+        "limit": page_size,
+        "offset": (page - 1) * page_size,
+    }
+
+    # Apply pagination
+    # NOTE: Including this here only for quickness.
+    # Because other routes will use this functionality,
+    # I'd move this elesewhere.
+    total_tweets = db.execute(count_statement, params).scalar()
+
+    # Execute the query and return results
+    filtered_tweets = [
+        _tweet_to_dict(row) for row in db.execute(page_statement, params)
+    ]
+
+    return {
+        "tweets": filtered_tweets,
+        "total_tweets": total_tweets,
+    }
+
+
+# Built once per combination of filters present and content type, the day,
+# month and year values and the page are bound at execution time.
+@lru_cache(maxsize=None)
+def _filtered_data_statements(
+    has_day: bool,
+    has_month: bool,
+    has_year: bool,
+    content_type: Optional[str],
+    include_text: bool,
+):
+    filters = []
     # Apply filters based on provided parameters
-    if data_filtering_params.day:
-        query = query.filter(Tweet.day == data_filtering_params.day)
-    if data_filtering_params.month:
-        query = query.filter(Tweet.month == data_filtering_params.month)
-    if data_filtering_params.year:
-        query = query.filter(Tweet.year == data_filtering_params.year)
-    if content_type := data_filtering_params.content_type_validated:
+    if has_day:
+        filters.append(Tweet.day == bindparam("day", type_=Integer))
+    if has_month:
+        filters.append(Tweet.month == bindparam("month", type_=Integer))
+    if has_year:
+        filters.append(Tweet.year == bindparam("year", type_=Integer))
+    if content_type:
         # NOTE: these filters could be moved out.
         threatening_filter = or_(
             Tweet.threat_level == "Medium",
@@ -73,13 +138,13 @@ async def get_filtered_data(
             Tweet.hateful.is_(None),
         )
         if content_type == THREATENING:
-            query = query.filter(threatening_filter)
+            filters.append(threatening_filter)
         elif content_type == NON_THREATENING:
-            query = query.filter(non_threatening_filter)
+            filters.append(non_threatening_filter)
         elif content_type == HATEFUL:
-            query = query.filter(hateful_filter)
+            filters.append(hateful_filter)
         elif content_type == NEUTRAL:
-            query.filter(
+            filters.append(
                 and_(
                     non_threatening_filter,
                     non_hateful_filter,
@@ -88,17 +153,27 @@ async def get_filtered_data(
         else:
             raise NotImplementedError
 
-    # Apply pagination
-    # NOTE: Including this here only for quickness.
-    # Because other routes will use this functionality,
-    # I'd move this elesewhere.
-    total_tweets = query.count()
-    query = query.offset((page - 1) * page_size).limit(page_size)
+    count_statement = select(func.count()).select_from(Tweet).where(*filters)
+    page_statement = select(Tweet)
+    # The text lives in its own table, only join it when it's asked for.
+    if include_text:
+        page_statement = page_statement.add_columns(
+            TweetText.full_text, TweetText.text, TweetText.clean_text
+        ).outerjoin(TweetText, TweetText.id == Tweet.id)
+    page_statement = (
+        page_statement.where(*filters)
+        .offset(bindparam("offset"))
+        .limit(bindparam("limit"))
+    )
+    return count_statement, page_statement
 
-    # Execute the query and return results
-    filtered_tweets = query.all()
 
-    return {
-        "tweets": filtered_tweets,
-        "total_tweets": total_tweets,
+def _tweet_to_dict(row):
+    tweet, *texts = row
+    result = {
+        column.key: getattr(tweet, column.key) for column in Tweet.__table__.columns
     }
+    if texts:
+        full_text, text, clean_text = texts
+        result.update(full_text=full_text, text=text, clean_text=clean_text)
+    return result
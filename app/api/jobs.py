@@ -0,0 +1,80 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+
+from app.jobs import JOB_KINDS, SUCCEEDED, job_runner
+from app.limiter import limiter
+from app.models.request.jobs import JobRequest
+
+jobs = APIRouter(
+    prefix="/jobs",
+    responses={
+        404: {"description": "Not found"},
+    },
+)
+
+
+def _get_job(job_id: str) -> dict:
+    job = job_runner.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@jobs.post(
+    "/", status_code=202, dependencies=[Depends(limiter.limit("5/minute"))]
+)
+async def submit_job(request: Request, job_request: JobRequest):
+    """
+    Description: This endpoint submits a long running analysis or export as a background job. The job runs one of the existing queries with the same parameters as its endpoint, but without the request timeout and with page sizes of up to 100000 results.
+
+    Parameters:
+    - kind: The analysis to run: key_user_stats, tweet_stats, tweet_trends, tweet_distribution, tweet_heatmap or filtered_data.
+    - params: The parameters of the corresponding endpoint, e.g. {"metric": "author", "time_interval": "month"} for tweet_trends. For filtered_data, the filtering parameters along with page and page_size.
+
+    Response:
+    - job_id: The id to poll the job status and fetch its result with.
+    - status: The status of the job, queued at first.
+    """
+    job_kind = JOB_KINDS.get(job_request.kind)
+    if job_kind is None:
+        raise HTTPException(status_code=422, detail="Invalid job kind")
+    try:
+        params = job_kind.params_model.model_validate(job_request.params)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+    job = await run_in_threadpool(job_runner.submit, job_request.kind, params)
+    return {"job_id": job["id"], "status": job["status"]}
+
+
+@jobs.get("/{job_id}")
+async def get_job(job_id: str):
+    """
+    Description: This endpoint returns the status of a job. Finished jobs expire after an hour by default.
+
+    Response:
+    - id, kind, params: The job as it was submitted.
+    - status: queued, running, succeeded or failed.
+    - error: Why the job failed, if it did.
+    - created_at, deadline, finished_at, expires_at: Unix timestamps of the job's lifecycle. A job still queued or running at its deadline has failed.
+    """
+    return await run_in_threadpool(_get_job, job_id)
+
+
+@jobs.get("/{job_id}/result")
+async def get_job_result(job_id: str):
+    """
+    Description: This endpoint returns the result of a succeeded job, in the same format as the response of the corresponding endpoint.
+    """
+    job = await run_in_threadpool(_get_job, job_id)
+    if job["status"] != SUCCEEDED:
+        detail = f"Job is {job['status']}"
+        if job["error"]:
+            detail += f": {job['error']}"
+        raise HTTPException(status_code=409, detail=detail)
+    return FileResponse(
+        job_runner.store.result_path(job_id), media_type="application/json"
+    )
@@ -0,0 +1,71 @@
+import asyncio
+
+from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from app.live import tweet_count_broadcaster
+
+live = APIRouter(
+    prefix="/live",
+    responses={
+        404: {"description": "Not found"},
+    },
+)
+
+
+@live.websocket("/twitter/counts")
+async def tweet_counts_websocket(websocket: WebSocket):
+    """
+    Description: This websocket pushes the tweet counts of every ingested batch as they're committed, so that dashboards don't need to poll the stats and heatmap endpoints.
+
+    Messages:
+    - counts: An object keyed by day (e.g. "2023-09-05") containing the number of new tweets ("total") and their count per content type (threatening, non-threatening, hateful, neutral).
+    """
+    await websocket.accept()
+    queue = await tweet_count_broadcaster.subscribe()
+
+    async def wait_for_disconnect():
+        # Messages from the client are ignored.
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    # Notices a client going away right away rather than on the next update,
+    # which may be a long time coming.
+    disconnected = asyncio.ensure_future(wait_for_disconnect())
+    update = None
+    try:
+        while True:
+            update = asyncio.ensure_future(queue.get())
+            await asyncio.wait(
+                {disconnected, update}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnected.done():
+                break
+            await websocket.send_text(update.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        disconnected.cancel()
+        if update is not None:
+            update.cancel()
+        tweet_count_broadcaster.unsubscribe(queue)
+
+
+@live.get("/twitter/counts/stream")
+async def tweet_counts_stream(request: Request):
+    """
+    Description: This endpoint streams the tweet counts of every ingested batch as Server-Sent Events. It's the equivalent of the /live/twitter/counts websocket for clients using EventSource.
+
+    Response:
+    - A text/event-stream where the data of each event is an object with the same format as the websocket messages.
+    """
+    queue = await tweet_count_broadcaster.subscribe()
+
+    async def events():
+        try:
+            while True:
+                yield f"data: {await queue.get()}\n\n"
+        finally:
+            tweet_count_broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
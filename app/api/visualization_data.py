@@ -3,12 +3,19 @@ from functools import lru_cache
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from sqlalchemy import func
+from sqlalchemy import DateTime, String, bindparam, func, select
 from sqlalchemy.exc import InvalidRequestError
 from sqlalchemy.orm import Session
 
-from app.db.database import get_db
+from app.admission import (
+    ADMISSION_POLICIES,
+    Admission,
+    admission,
+    check_query_cost,
+)
+from app.coalescing import make_key, single_flight
 from app.db.models.tweets import Tweet
+from app.http_cache import conditional_cache
 from app.limiter import limiter
 
 visualization_data = APIRouter(
@@ -19,10 +26,11 @@ visualization_data = APIRouter(
 )
 
 
-@visualization_data.get("/twitter/trends")
-@limiter.limit("5/minute")
-@lru_cache(maxsize=None)
-def get_tweet_trends(
+@visualization_data.get(
+    "/twitter/trends",
+    dependencies=[Depends(conditional_cache), Depends(limiter.limit("5/minute"))],
+)
+async def get_tweet_trends(
     request: Request,
     metric: str = Query(..., description="The metric to analyze (e.g., author)"),
     time_interval: str = Query(..., description="The time interval (e.g., day, month)"),
@@ -30,7 +38,7 @@ def get_tweet_trends(
     end_date: Optional[datetime] = Query(None, description="End date for analysis"),
     page: int = Query(default=1, ge=1, description="Page number"),
     page_size: int = Query(default=10, ge=1, le=100, description="Page size"),
-    db: Session = Depends(get_db),
+    admitted: Admission = Depends(admission("visualization_data.tweet_trends")),
 ):
     """
     Description: This endpoint retrieves trends data from the tweets database table based on the specified parameters. It allows users to analyze trends over time for a given metric, such as the number of retweets, replies, or mentions, within a specified time interval (e.g., day, month). Pagination is supported to facilitate browsing through large result sets.
@@ -53,43 +61,37 @@ def get_tweet_trends(
     if not hasattr(Tweet, metric):
         raise HTTPException(status_code=400, detail="Invalid metric")
 
-    # Calculate offset based on page number and page size
-    offset = (page - 1) * page_size
-
-    # Construct the query based on parameters
-    query = db.query(
-        func.date_trunc(time_interval, Tweet.datetime).label("date"),
-        getattr(Tweet, metric).label("value"),
-        func.count().label("count"),
+    key = make_key(
+        "visualization_data.tweet_trends",
+        metric=metric,
+        time_interval=time_interval,
+        start_date=start_date,
+        end_date=end_date,
+        page=page,
+        page_size=page_size,
+    )
+    return await single_flight.do_async(
+        key,
+        lambda: admitted.run(
+            lambda db: fetch_tweet_trends(
+                db,
+                metric,
+                time_interval,
+                start_date,
+                end_date,
+                page,
+                page_size,
+                max_cost=ADMISSION_POLICIES["visualization_data.tweet_trends"].max_cost,
+            )
+        ),
     )
-
-    if start_date:
-        query = query.filter(Tweet.datetime >= start_date)
-    if end_date:
-        query = query.filter(Tweet.datetime <= end_date)
-
-    query = query.group_by("date", "value").order_by("date")
-
-    # Paginate the results
-    total_results = query.count()
-    results = query.offset(offset).limit(page_size).all()
-
-    # Return paginated results
-    return {
-        "total_results": total_results,
-        "page": page,
-        "page_size": page_size,
-        "data": [
-            {"date": row.date, "value": row.value, "count": row.count}
-            for row in results
-        ],
-    }
 
 
-@visualization_data.get("/twitter/distribution")
-@limiter.limit("5/minute")
-@lru_cache(maxsize=None)
-def get_tweet_distribution(
+@visualization_data.get(
+    "/twitter/distribution",
+    dependencies=[Depends(conditional_cache), Depends(limiter.limit("5/minute"))],
+)
+async def get_tweet_distribution(
     request: Request,
     metric: str = Query(
         ..., description="The metric to analyze (e.g., follower_count)"
@@ -100,7 +102,9 @@ def get_tweet_distribution(
     top_n: Optional[int] = Query(None, description="Limit the number of results"),
     page: int = Query(default=1, ge=1, description="Page number"),
     page_size: int = Query(default=10, ge=1, le=100, description="Page size"),
-    db: Session = Depends(get_db),
+    admitted: Admission = Depends(
+        admission("visualization_data.tweet_distribution")
+    ),
 ):
     """
     Description: This endpoint retrieves distribution data from the Twitter dataset based on the specified parameters. It allows users to analyze the distribution of a given metric across different categories, such as authors or languages, within the dataset. Pagination is supported to facilitate browsing through large result sets.
@@ -127,43 +131,43 @@ def get_tweet_distribution(
     if not hasattr(Tweet, category):
         raise HTTPException(status_code=400, detail="Invalid category")
 
-    # Calculate offset based on page number and page size
-    offset = (page - 1) * page_size
-
-    # Construct the query based on parameters
-    try:
-        query = db.query(getattr(Tweet, category), func.count().label("value"))
-        query = query.group_by(getattr(Tweet, category)).order_by(func.count().desc())
-
-        if top_n:
-            query = query.limit(top_n)
-
-        # Paginate the results
-        total_results = query.count()
-        results = query.offset(offset).limit(page_size).all()
-
-        # Return paginated results
-        return {
-            "total_results": total_results,
-            "page": page,
-            "page_size": page_size,
-            "data": [{"category": row[0], "value": row[1]} for row in results],
-        }
-    except InvalidRequestError as e:
-        raise HTTPException(status_code=500, detail="Invalid request: " + str(e))
+    key = make_key(
+        "visualization_data.tweet_distribution",
+        metric=metric,
+        category=category,
+        top_n=top_n,
+        page=page,
+        page_size=page_size,
+    )
+    return await single_flight.do_async(
+        key,
+        lambda: admitted.run(
+            lambda db: fetch_tweet_distribution(
+                db,
+                category,
+                top_n,
+                page,
+                page_size,
+                max_cost=ADMISSION_POLICIES[
+                    "visualization_data.tweet_distribution"
+                ].max_cost,
+            )
+        ),
+    )
 
 
-@visualization_data.get("/twitter/heatmap")
-@limiter.limit("5/minute")
-@lru_cache(maxsize=None)
-def get_tweet_heatmap(
+@visualization_data.get(
+    "/twitter/heatmap",
+    dependencies=[Depends(conditional_cache), Depends(limiter.limit("5/minute"))],
+)
+async def get_tweet_heatmap(
     request: Request,
     start_date: datetime = Query(..., description="Start date of the date range"),
     end_date: datetime = Query(..., description="End date of the date range"),
     threat_level: str = Query(
         None, description="Threat level to filter tweets (optional)"
     ),
-    db: Session = Depends(get_db),
+    admitted: Admission = Depends(admission("visualization_data.tweet_heatmap")),
 ):
     """
     Description: This endpoint retrieves heatmap data for tweets based on the specified date range. It allows users to analyze tweet activity over time and visualize trends. Optionally, users can filter tweets by threat level to focus on specific types of tweets.
@@ -177,18 +181,110 @@ def get_tweet_heatmap(
     - A 2D list representing the heatmap data, where each row corresponds to a month and each column corresponds to a day. The value at each cell represents the count of tweets for that day.
     """
 
-    # Query the database for tweet counts per day
-    query = db.query(Tweet.year, Tweet.month, Tweet.day)
+    key = make_key(
+        "visualization_data.tweet_heatmap",
+        start_date=start_date,
+        end_date=end_date,
+        threat_level=threat_level,
+    )
+    return await single_flight.do_async(
+        key,
+        lambda: admitted.run(
+            lambda db: fetch_tweet_heatmap(db, start_date, end_date, threat_level)
+        ),
+    )
 
-    if threat_level:
-        query = query.filter(Tweet.threat_level == threat_level)
 
-    tweet_counts = (
-        query.filter(Tweet.datetime >= start_date, Tweet.datetime <= end_date)
-        .group_by(Tweet.year, Tweet.month, Tweet.day)
-        .order_by(Tweet.year, Tweet.month, Tweet.day)
-        .all()
+def fetch_tweet_trends(
+    db: Session,
+    metric: str,
+    time_interval: str,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    page: int,
+    page_size: int,
+    max_cost: Optional[float] = None,
+):
+    # Calculate offset based on page number and page size
+    offset = (page - 1) * page_size
+
+    count_statement, page_statement = _tweet_trends_statements(
+        metric, start_date is not None, end_date is not None
     )
+    params = {
+        "time_interval": time_interval,
+        "start_date": start_date,
+        "end_date": end_date,
+        "limit": page_size,
+        "offset": offset,
+    }
+    check_query_cost(db, count_statement, params, max_cost)
+
+    # Paginate the results
+    total_results = db.execute(count_statement, params).scalar()
+    results = db.execute(page_statement, params).all()
+
+    # Return paginated results
+    return {
+        "total_results": total_results,
+        "page": page,
+        "page_size": page_size,
+        "data": [
+            {"date": row.date, "value": row.value, "count": row.count}
+            for row in results
+        ],
+    }
+
+
+def fetch_tweet_distribution(
+    db: Session,
+    category: str,
+    top_n: Optional[int],
+    page: int,
+    page_size: int,
+    max_cost: Optional[float] = None,
+):
+    # Calculate offset based on page number and page size
+    offset = (page - 1) * page_size
+
+    # Construct the query based on parameters
+    try:
+        count_statement, page_statement = _tweet_distribution_statements(
+            category, bool(top_n)
+        )
+        params = {"top_n": top_n, "limit": page_size, "offset": offset}
+        check_query_cost(db, count_statement, params, max_cost)
+
+        # Paginate the results
+        total_results = db.execute(count_statement, params).scalar()
+        results = db.execute(page_statement, params).all()
+
+        # Return paginated results
+        return {
+            "total_results": total_results,
+            "page": page,
+            "page_size": page_size,
+            "data": [{"category": row[0], "value": row[1]} for row in results],
+        }
+    except InvalidRequestError as e:
+        raise HTTPException(status_code=500, detail="Invalid request: " + str(e))
+
+
+def fetch_tweet_heatmap(
+    db: Session,
+    start_date: datetime,
+    end_date: datetime,
+    threat_level: Optional[str] = None,
+):
+    # Query the database for tweet counts per day
+    tweet_counts = db.execute(
+        _tweet_heatmap_statement(bool(threat_level)),
+        {
+            "start_date": start_date,
+            "end_date": end_date,
+            "threat_level": threat_level,
+        },
+    ).all()
 
     # Create a 2D list to store heatmap data
     heatmap_data = [
@@ -200,3 +296,75 @@ def get_tweet_heatmap(
         heatmap_data[month - 1][day - 1] += 1  # Adjust month and day indices
 
     return heatmap_data
+
+
+# Built once per metric and date bounds present, the interval, dates and page
+# are bound at execution time.
+@lru_cache(maxsize=None)
+def _tweet_trends_statements(metric: str, has_start_date: bool, has_end_date: bool):
+    statement = select(
+        func.date_trunc(
+            bindparam("time_interval", type_=String), Tweet.datetime
+        ).label("date"),
+        getattr(Tweet, metric).label("value"),
+        func.count().label("count"),
+    )
+
+    if has_start_date:
+        statement = statement.where(
+            Tweet.datetime >= bindparam("start_date", type_=DateTime)
+        )
+    if has_end_date:
+        statement = statement.where(
+            Tweet.datetime <= bindparam("end_date", type_=DateTime)
+        )
+
+    statement = statement.group_by("date", "value").order_by("date")
+
+    count_statement = select(func.count()).select_from(statement.subquery())
+    page_statement = statement.offset(bindparam("offset")).limit(bindparam("limit"))
+    return count_statement, page_statement
+
+
+# Built once per category, with or without top_n, which is bound at execution
+# time along with the page.
+@lru_cache(maxsize=None)
+def _tweet_distribution_statements(category: str, has_top_n: bool):
+    column = getattr(Tweet, category)
+    statement = (
+        select(column.label("category"), func.count().label("value"))
+        .group_by(column)
+        .order_by(func.count().desc())
+    )
+
+    # Paginate within the top N categories rather than replacing their limit.
+    if has_top_n:
+        top_n = statement.limit(bindparam("top_n")).subquery()
+        statement = select(top_n.c.category, top_n.c.value).order_by(
+            top_n.c.value.desc()
+        )
+
+    count_statement = select(func.count()).select_from(statement.subquery())
+    page_statement = statement.offset(bindparam("offset")).limit(bindparam("limit"))
+    return count_statement, page_statement
+
+
+# Built once with and once without the threat level filter, its value and the
+# dates are bound at execution time.
+@lru_cache(maxsize=None)
+def _tweet_heatmap_statement(has_threat_level: bool):
+    statement = select(Tweet.year, Tweet.month, Tweet.day)
+
+    if has_threat_level:
+        statement = statement.where(
+            Tweet.threat_level == bindparam("threat_level", type_=String)
+        )
+
+    return (
+        statement.where(
+            Tweet.datetime >= bindparam("start_date", type_=DateTime),
+            Tweet.datetime <= bindparam("end_date", type_=DateTime),
+        )
+        .group_by(Tweet.year, Tweet.month, Tweet.day)
+        .order_by(Tweet.year, Tweet.month, Tweet.day)
+    )
@@ -0,0 +1,57 @@
+import asyncio
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+def make_key(route: str, **params: Any) -> Tuple[Hashable, ...]:
+    """
+    Build a coalescing key out of a route name and its query parameters.
+
+    Parameters are sorted by name and dates are normalized to their ISO
+    representation so that equivalent requests map to the same key.
+    """
+    normalized = []
+    for name, value in sorted(params.items()):
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        normalized.append((name, value))
+    return (route, *normalized)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls sharing the same key into a single execution.
+
+    The first caller for a key (the leader) runs the function, every caller
+    that arrives while it is still in flight waits and receives the leader's
+    result (or exception). Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._futures: Dict[Hashable, asyncio.Future] = {}
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await `fn()` for `key` from an async route.
+
+        `fn()` runs as a task of its own, so the shared query keeps running
+        even if the request that started it is cancelled. It mustn't use
+        that request's dependencies, e.g. its database session, which are
+        closed once it is.
+        """
+        task = self._futures.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._futures[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._futures.get(key) is task:
+            del self._futures[key]
+        # Mark the exception as retrieved in case every waiter went away.
+        if not task.cancelled():
+            task.exception()
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, DateTime, Integer, func
+
+from app.db.database import Base
+
+
+class DatasetGeneration(Base):
+    """
+    Single row table holding the version of the tweets dataset.
+    Ingest bumps `generation` whenever it writes new data.
+    """
+
+    __tablename__ = "dataset_generation"
+
+    id = Column(Integer, primary_key=True)
+
+    generation = Column(Integer, nullable=False, default=1)
+    updated_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
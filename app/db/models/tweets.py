@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, DateTime, Integer, String
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
 from app.db.database import Base
 
 
@@ -9,12 +9,10 @@ class Tweet(Base):
 
     author = Column(String, index=True)
     author_created_utc = Column(DateTime)
-    clean_text = Column(String)
     created_at = Column(DateTime, index=True)
     datetime = Column(DateTime, index=True)
     day = Column(Integer, index=True)
     follower_count = Column(Integer)
-    full_text = Column(String)
     hateful = Column(String, default=False, index=True)
     lang = Column(String, index=True)
     len_filter = Column(Boolean, default=False, index=True)
@@ -24,9 +22,23 @@ class Tweet(Base):
     retweet_count = Column(Integer)
     retweeted = Column(Boolean)
     second = Column(Integer)
-    text = Column(String)
     threat_level = Column(String, index=True)
     year = Column(Integer, index=True)
     year_month = Column(String, index=True)
     year_month_day = Column(String, index=True)
     zip = Column(Integer, index=True)
+
+
+class TweetText(Base):
+    """
+    Text columns of a tweet, kept apart from `tweets` so that aggregate scans
+    don't have to read them.
+    """
+
+    __tablename__ = "tweet_texts"
+
+    id = Column(String, ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True)
+
+    clean_text = Column(String)
+    full_text = Column(String)
+    text = Column(String)
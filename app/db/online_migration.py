@@ -0,0 +1,543 @@
+"""
+Helpers for Alembic migrations of large tables that have to keep serving
+reads and writes while they run.
+
+A plain `op.alter_column` changing a type rewrites the whole table under an
+ACCESS EXCLUSIVE lock. `change_column_type` instead:
+
+1. adds a nullable column of the new type, a catalog-only change,
+2. keeps it in sync with the old column through a trigger, so that writes
+   made during the migration aren't lost,
+3. backfills the existing rows in small batches, each committed on its own
+   and followed by a pause, logging its progress,
+4. swaps the columns in a short transaction.
+
+Only the steps 1 and 4 take an exclusive lock, and only for an instant.
+`lock_timeout` makes them give up rather than queue reads behind them while
+a long query holds the table.
+
+Every step can be run again, so a migration that failed part way, e.g. on
+the lock timeout of the swap, is retried by running it again: it resumes
+the backfill where it stopped and skips the constraint and index already
+built.
+
+Whatever is dropped along with the old column is carried over to the new
+one: its default, NOT NULL and serial sequence, the primary key or unique
+constraints on it, rebuilt from indexes built beforehand with
+`create_index_concurrently`, and the foreign keys from or to it, recreated
+NOT VALID in the swap and validated after it. Other indexes of the column
+have to be named to be rebuilt, check and exclusion constraints aren't
+supported.
+
+Progress is logged at INFO, as set up for this module in alembic.ini.
+"""
+import logging
+import time
+from typing import Optional, Sequence
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+# Pause after each batch, leaving room to the regular traffic, vacuum and
+# replication
+DEFAULT_PAUSE_SECONDS = 0.1
+DEFAULT_LOCK_TIMEOUT = "5s"
+
+# Last key backfilled for each column, committed along with each batch
+PROGRESS_TABLE = "online_migration_progress"
+
+
+def _trigger_name(table: str, target: str) -> str:
+    return f"{table}_{target}_dual_write"
+
+
+def _set_lock_timeout(lock_timeout: str):
+    op.execute(f"SET LOCAL lock_timeout = '{lock_timeout}'")
+
+
+def _has_constraint(table: str, name: str) -> bool:
+    return (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT 1 FROM pg_constraint "
+                "WHERE conrelid = CAST(:table AS regclass) AND conname = :name"
+            ),
+            {"table": table, "name": name},
+        )
+        .first()
+        is not None
+    )
+
+
+def _has_column(table: str, column: str) -> bool:
+    return (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT 1 FROM pg_attribute WHERE attrelid = CAST(:table AS regclass) "
+                "AND attname = :column AND NOT attisdropped"
+            ),
+            {"table": table, "column": column},
+        )
+        .first()
+        is not None
+    )
+
+
+def _has_progress(table: str, column: str) -> bool:
+    connection = op.get_bind()
+    progress_table = connection.execute(
+        sa.text("SELECT to_regclass(:name)"), {"name": PROGRESS_TABLE}
+    ).scalar()
+    if progress_table is None:
+        return False
+    return (
+        connection.execute(
+            sa.text(
+                f"SELECT 1 FROM {PROGRESS_TABLE} "
+                f"WHERE table_name = :table AND column_name = :column"
+            ),
+            {"table": table, "column": column},
+        ).first()
+        is not None
+    )
+
+
+def _column_definition(table: str, column: str):
+    # NOT NULL, identity, default and the sequence of a serial column
+    return (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT a.attnotnull AS not_null, a.attidentity <> '' AS identity, "
+                "pg_get_expr(d.adbin, d.adrelid) AS default, "
+                "pg_get_serial_sequence(:table, :column) AS sequence "
+                "FROM pg_attribute a LEFT JOIN pg_attrdef d "
+                "ON d.adrelid = a.attrelid AND d.adnum = a.attnum "
+                "WHERE a.attrelid = CAST(:table AS regclass) AND a.attname = :column"
+            ),
+            {"table": table, "column": column},
+        )
+        .one()
+    )
+
+
+def _column_constraints(table: str, column: str):
+    # The constraints on the column and the foreign keys referencing it
+    return (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT c.conname AS name, c.contype AS type, "
+                "CAST(CAST(c.conrelid AS regclass) AS text) AS table, "
+                "pg_get_constraintdef(c.oid) AS definition, "
+                "c.convalidated AS validated, "
+                "ARRAY(SELECT k.attname FROM unnest(c.conkey) WITH ORDINALITY "
+                "AS u(attnum, n) JOIN pg_attribute k "
+                "ON k.attrelid = c.conrelid AND k.attnum = u.attnum "
+                "ORDER BY u.n) AS columns "
+                "FROM pg_constraint c "
+                "JOIN pg_attribute a ON a.attrelid = CAST(:table AS regclass) "
+                "AND a.attname = :column "
+                "WHERE (c.conrelid = a.attrelid AND a.attnum = ANY(c.conkey)) "
+                "OR (c.contype = 'f' AND c.confrelid = a.attrelid "
+                "AND a.attnum = ANY(c.confkey)) "
+                "ORDER BY c.conname"
+            ),
+            {"table": table, "column": column},
+        )
+        .all()
+    )
+
+
+def _column_indexes(table: str, column: str):
+    # The indexes using the column, other than those backing a constraint
+    return (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT CAST(CAST(i.indexrelid AS regclass) AS text) AS name, "
+                "i.indisunique AS unique, am.amname AS method, "
+                "(i.indexprs IS NOT NULL OR i.indpred IS NOT NULL "
+                "OR i.indnkeyatts < i.indnatts) AS has_expressions, "
+                "ARRAY(SELECT k.attname FROM unnest(CAST(i.indkey AS int2[])) "
+                "WITH ORDINALITY AS u(attnum, n) JOIN pg_attribute k "
+                "ON k.attrelid = i.indrelid AND k.attnum = u.attnum "
+                "ORDER BY u.n) AS columns "
+                "FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid "
+                "JOIN pg_am am ON am.oid = c.relam "
+                "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attname = :column "
+                "WHERE i.indrelid = CAST(:table AS regclass) "
+                "AND EXISTS (SELECT 1 FROM pg_depend d "
+                "WHERE d.classid = CAST('pg_class' AS regclass) "
+                "AND d.objid = i.indexrelid AND d.refobjid = i.indrelid "
+                "AND d.refobjsubid = a.attnum) "
+                "AND NOT EXISTS (SELECT 1 FROM pg_constraint "
+                "WHERE conindid = i.indexrelid) "
+                "ORDER BY name"
+            ),
+            {"table": table, "column": column},
+        )
+        .all()
+    )
+
+
+def _unvalidated_foreign_keys(table: str, column: str):
+    return [
+        constraint
+        for constraint in _column_constraints(table, column)
+        if constraint.type == "f" and not constraint.validated
+    ]
+
+
+def create_dual_write_trigger(table: str, source: str, target: str, using: str):
+    """
+    Keep `target` set to `using` on every insert and update of `table`.
+
+    `using` is an SQL expression of the source column, written as
+    `{column}`, e.g. "{column}::varchar".
+    """
+    name = _trigger_name(table, target)
+    expression = using.format(column=f"NEW.{source}")
+    op.execute(
+        f"CREATE OR REPLACE FUNCTION {name}() RETURNS trigger AS $$ "
+        f"BEGIN NEW.{target} := {expression}; RETURN NEW; END "
+        f"$$ LANGUAGE plpgsql"
+    )
+    op.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+    op.execute(
+        f"CREATE TRIGGER {name} BEFORE INSERT OR UPDATE ON {table} "
+        f"FOR EACH ROW EXECUTE PROCEDURE {name}()"
+    )
+
+
+def drop_dual_write_trigger(table: str, target: str):
+    name = _trigger_name(table, target)
+    op.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+    op.execute(f"DROP FUNCTION IF EXISTS {name}()")
+
+
+def backfill(
+    table: str,
+    target: str,
+    set_to: str,
+    key: str = "id",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    pause_seconds: float = DEFAULT_PAUSE_SECONDS,
+):
+    """
+    Set `target` to the SQL expression `set_to` on all the rows of `table`,
+    walking them in batches of `batch_size` in the order of `key`.
+
+    Each batch is committed on its own along with its last key, so row locks
+    are only held for the duration of a batch and an interrupted backfill
+    resumes after the last batch done. Must run within
+    `op.get_context().autocommit_block()`.
+    """
+    connection = op.get_bind()
+    connection.execute(
+        sa.text(
+            f"CREATE TABLE IF NOT EXISTS {PROGRESS_TABLE} ("
+            f"table_name varchar, column_name varchar, last_key varchar, "
+            f"PRIMARY KEY (table_name, column_name))"
+        )
+    )
+    last_key = connection.execute(
+        sa.text(
+            f"SELECT last_key FROM {PROGRESS_TABLE} "
+            f"WHERE table_name = :table AND column_name = :column"
+        ),
+        {"table": table, "column": target},
+    ).scalar()
+    if last_key is not None:
+        logger.info(
+            "Resuming the backfill of %s.%s after %s", table, target, last_key
+        )
+
+    # Planner estimate, counting the rows would scan the whole table.
+    estimated_rows = connection.execute(
+        sa.text(
+            "SELECT reltuples FROM pg_class WHERE oid = CAST(:table AS regclass)"
+        ),
+        {"table": table},
+    ).scalar()
+    estimated_rows = max(int(estimated_rows), 0)
+    statement = sa.text(
+        f"WITH batch AS ("
+        f"  SELECT {key} AS batch_key FROM {table}"
+        f"  WHERE :last_key IS NULL OR {key} > :last_key"
+        f"  ORDER BY {key} LIMIT :batch_size"
+        f"), updated AS ("
+        f"  UPDATE {table} SET {target} = {set_to}"
+        f"  FROM batch WHERE {table}.{key} = batch.batch_key"
+        f"  AND {table}.{target} IS DISTINCT FROM {set_to}"
+        f"), progress AS ("
+        f"  INSERT INTO {PROGRESS_TABLE} (table_name, column_name, last_key)"
+        f"  SELECT :table, :column, max(batch_key)::varchar FROM batch"
+        f"  HAVING count(*) > 0"
+        f"  ON CONFLICT (table_name, column_name)"
+        f"  DO UPDATE SET last_key = excluded.last_key"
+        f") "
+        f"SELECT max(batch_key)::varchar, count(*) FROM batch"
+    )
+
+    done = 0
+    started_at = time.monotonic()
+    while True:
+        batch_last_key, count = connection.execute(
+            statement,
+            {
+                "last_key": last_key,
+                "batch_size": batch_size,
+                "table": table,
+                "column": target,
+            },
+        ).one()
+        if not count:
+            break
+        last_key = batch_last_key
+        done += count
+        logger.info(
+            "Backfilled %s.%s: %d of ~%d rows (%.0f%%), %.0fs elapsed",
+            table,
+            target,
+            done,
+            estimated_rows,
+            100 * done / max(estimated_rows, done),
+            time.monotonic() - started_at,
+        )
+        time.sleep(pause_seconds)
+
+
+def create_index_concurrently(
+    index_name: str, table: str, columns: Sequence[str], **kw
+):
+    """
+    Build an index without blocking the writes to `table`. Must run within
+    `op.get_context().autocommit_block()`.
+
+    A valid index of that name is kept as is. An invalid one, left behind
+    by an interrupted build, is dropped and built again.
+    """
+    valid = (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT indisvalid FROM pg_index "
+                "WHERE indexrelid = to_regclass(:index_name)"
+            ),
+            {"index_name": index_name},
+        )
+        .scalar()
+    )
+    if valid:
+        logger.info("Index %s already built", index_name)
+        return
+    if valid is not None:
+        op.drop_index(index_name, table_name=table, postgresql_concurrently=True)
+    logger.info("Building index %s on %s", index_name, table)
+    op.create_index(index_name, table, columns, postgresql_concurrently=True, **kw)
+
+
+def change_column_type(
+    table: str,
+    column: str,
+    type_: sa.types.TypeEngine,
+    using: str = "{column}",
+    nullable: Optional[bool] = None,
+    key: str = "id",
+    index_name: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    pause_seconds: float = DEFAULT_PAUSE_SECONDS,
+    lock_timeout: str = DEFAULT_LOCK_TIMEOUT,
+):
+    """
+    Change the type of `column` to `type_` without rewriting `table` under
+    an exclusive lock. `using` converts the old values, as the USING clause
+    of an ALTER COLUMN, with the column written as `{column}`. It converts
+    the column's default too.
+
+    `key` must be a unique, indexed column, the rows are backfilled in its
+    order. `nullable` defaults to that of the old column. `index_name` names
+    the index of the column to rebuild on the new one, or to build on it if
+    there is none yet. Any other index of the column is refused rather than
+    dropped with it.
+
+    The columns referencing a primary or unique key changed this way must
+    already have a type comparable to the new one, or the swap fails and is
+    rolled back.
+
+    Commits the transaction of the migration along the way.
+    """
+    new_column = f"{column}_new"
+    if _has_progress(table, new_column) and not _has_column(table, new_column):
+        logger.info("Columns of %s.%s already swapped", table, column)
+    else:
+        _change_column_type(
+            table,
+            column,
+            type_,
+            using,
+            nullable,
+            key,
+            index_name,
+            batch_size,
+            pause_seconds,
+            lock_timeout,
+        )
+
+    # Commits the swap. Validating only takes locks that allow reads and
+    # writes.
+    with op.get_context().autocommit_block():
+        for constraint in _unvalidated_foreign_keys(table, column):
+            logger.info("Validating %s on %s", constraint.name, constraint.table)
+            op.execute(
+                f"ALTER TABLE {constraint.table} "
+                f"VALIDATE CONSTRAINT {constraint.name}"
+            )
+
+    op.execute(
+        sa.text(
+            f"DELETE FROM {PROGRESS_TABLE} "
+            f"WHERE table_name = :table AND column_name = :column"
+        ).bindparams(table=table, column=new_column)
+    )
+    # Leave no table behind for autogenerate to pick up once nothing is in
+    # progress.
+    op.execute(
+        f"DO $$ BEGIN "
+        f"IF NOT EXISTS (SELECT 1 FROM {PROGRESS_TABLE}) "
+        f"THEN DROP TABLE {PROGRESS_TABLE}; END IF; END $$"
+    )
+
+
+def _change_column_type(
+    table: str,
+    column: str,
+    type_: sa.types.TypeEngine,
+    using: str,
+    nullable: Optional[bool],
+    key: str,
+    index_name: Optional[str],
+    batch_size: int,
+    pause_seconds: float,
+    lock_timeout: str,
+):
+    definition = _column_definition(table, column)
+    constraints = _column_constraints(table, column)
+    indexes = _column_indexes(table, column)
+
+    if definition.identity:
+        raise ValueError(f"Can't change the type of the identity {table}.{column}")
+    unsupported = [c.name for c in constraints if c.type not in ("p", "u", "f")]
+    if unsupported:
+        raise ValueError(
+            f"Can't change the type of {table}.{column} online, check and "
+            f"exclusion constraints aren't supported: {', '.join(unsupported)}"
+        )
+    for index in indexes:
+        if index.name != index_name:
+            raise ValueError(
+                f"Index {index.name} would be dropped along with {table}.{column}, "
+                f"pass it as index_name to rebuild it"
+            )
+        if index.has_expressions:
+            raise ValueError(
+                f"Can't rebuild {index.name}, indexes with expressions, a "
+                f"predicate or included columns aren't supported"
+            )
+    keys = [c for c in constraints if c.type in ("p", "u")]
+    foreign_keys = [c for c in constraints if c.type == "f"]
+    primary_key = any(c.type == "p" for c in keys)
+    if nullable is None:
+        nullable = not definition.not_null
+    if primary_key and nullable:
+        raise ValueError(f"{table}.{column} is in a primary key, it can't be nullable")
+
+    new_column = f"{column}_new"
+    not_null_constraint = f"{new_column}_not_null"
+    set_to = using.format(column=f"{table}.{column}")
+
+    def new_columns(columns):
+        return [new_column if c == column else c for c in columns]
+
+    _set_lock_timeout(lock_timeout)
+    op.execute(
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {new_column} "
+        f"{type_.compile(dialect=postgresql.dialect())}"
+    )
+    create_dual_write_trigger(table, column, new_column, using)
+
+    # Commits the new column and its trigger, writes keep it in sync from
+    # there on.
+    with op.get_context().autocommit_block():
+        backfill(table, new_column, set_to, key, batch_size, pause_seconds)
+        if not nullable:
+            # A validated check constraint lets SET NOT NULL skip its scan of
+            # the table. Validating only takes a lock that allows writes.
+            if not _has_constraint(table, not_null_constraint):
+                op.execute(
+                    f"ALTER TABLE {table} ADD CONSTRAINT {not_null_constraint} "
+                    f"CHECK ({new_column} IS NOT NULL) NOT VALID"
+                )
+            op.execute(
+                f"ALTER TABLE {table} VALIDATE CONSTRAINT {not_null_constraint}"
+            )
+        for constraint in keys:
+            create_index_concurrently(
+                f"{constraint.name}_new",
+                table,
+                new_columns(constraint.columns),
+                unique=True,
+            )
+        if indexes:
+            create_index_concurrently(
+                f"{index_name}_new",
+                table,
+                new_columns(indexes[0].columns),
+                unique=indexes[0].unique,
+                postgresql_using=indexes[0].method,
+            )
+        elif index_name:
+            create_index_concurrently(f"{index_name}_new", table, [new_column])
+
+    _set_lock_timeout(lock_timeout)
+    drop_dual_write_trigger(table, new_column)
+    # The foreign keys referencing the column depend on the index of its key
+    # and would keep it from being dropped.
+    for constraint in foreign_keys:
+        op.execute(f"ALTER TABLE {constraint.table} DROP CONSTRAINT {constraint.name}")
+    if definition.sequence:
+        op.execute(
+            f"ALTER SEQUENCE {definition.sequence} OWNED BY {table}.{new_column}"
+        )
+    op.drop_column(table, column)
+    op.alter_column(table, new_column, new_column_name=column)
+    if definition.default is not None:
+        default = using.format(column=f"({definition.default})")
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT {default}")
+    if not nullable:
+        op.alter_column(table, column, nullable=False)
+        op.drop_constraint(not_null_constraint, table)
+    if index_name:
+        op.execute(f"ALTER INDEX {index_name}_new RENAME TO {index_name}")
+    for constraint in keys:
+        kind = "PRIMARY KEY" if constraint.type == "p" else "UNIQUE"
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {constraint.name} "
+            f"{kind} USING INDEX {constraint.name}_new"
+        )
+    for constraint in foreign_keys:
+        foreign_key = constraint.definition
+        if not constraint.validated:
+            foreign_key = foreign_key[: -len(" NOT VALID")]
+        op.execute(
+            f"ALTER TABLE {constraint.table} ADD CONSTRAINT {constraint.name} "
+            f"{foreign_key} NOT VALID"
+        )
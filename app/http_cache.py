@@ -0,0 +1,147 @@
+import hashlib
+from datetime import date, datetime, time, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.middleware.gzip import GZipResponder
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers
+from starlette.types import Message, Receive, Scope, Send
+
+from app.db.database import get_read_db
+from app.db.models.dataset_generation import DatasetGeneration
+
+# Responses smaller than this aren't worth compressing.
+COMPRESSION_MINIMUM_SIZE = 1000
+
+
+def _make_etag(request: Request, generation: int, today: Optional[date]) -> str:
+    # The response of a read endpoint only depends on its path, its query
+    # parameters and the dataset it runs against, and on the current date
+    # for the endpoints defaulting to it.
+    digest = hashlib.sha1(request.url.path.encode())
+    for name, value in sorted(request.query_params.multi_items()):
+        digest.update(f"\0{name}={value}".encode())
+    if today is not None:
+        digest.update(f"\0{today.isoformat()}".encode())
+    # Weak, because the body may be re-encoded by the compression middleware.
+    return f'W/"{generation}-{digest.hexdigest()}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag[2:]
+    return any(
+        candidate.strip().lstrip("W/") == opaque_tag
+        for candidate in if_none_match.split(",")
+    )
+
+
+def _not_modified_since(if_modified_since: str, last_modified) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    # HTTP dates have a one second resolution.
+    return last_modified.replace(microsecond=0) <= since
+
+
+def conditional_cache(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+):
+    """
+    Dependency adding validators to read endpoints and answering conditional
+    requests. The ETag and Last-Modified are derived from the dataset
+    generation, so a matching `If-None-Match` (or `If-Modified-Since`)
+    returns 304 before the route runs any query.
+    """
+    _conditional_response(request, response, db, today=None)
+
+
+def daily_conditional_cache(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+):
+    """
+    `conditional_cache` for endpoints whose default parameters depend on the
+    current date. Their validators also change at midnight.
+    """
+    _conditional_response(request, response, db, today=datetime.now().date())
+
+
+def _conditional_response(
+    request: Request, response: Response, db: Session, today: Optional[date]
+):
+    dataset = db.get(DatasetGeneration, 1)
+    if dataset is not None:
+        generation, updated_at = dataset.generation, dataset.updated_at
+    # Hand the connection back to the pool, the route may still have to
+    # wait for admission before running its own queries.
+    db.commit()
+    if dataset is None:
+        return
+
+    etag = _make_etag(request, generation, today)
+    last_modified = updated_at.astimezone(timezone.utc)
+    if today is not None:
+        # Local midnight, matching the datetime.now() of the endpoints.
+        midnight = datetime.combine(today, time()).astimezone(timezone.utc)
+        last_modified = max(last_modified, midnight)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, etag)
+    elif if_modified_since is not None:
+        not_modified = _not_modified_since(if_modified_since, last_modified)
+    else:
+        not_modified = False
+
+    if not_modified:
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+
+class _CompressionResponder(GZipResponder):
+    async def send_with_gzip(self, message: Message) -> None:
+        await super().send_with_gzip(message)
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            if content_type.startswith("text/event-stream"):
+                # Passed through as is, like a response already encoded.
+                self.content_encoding_set = True
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZip middleware leaving Server-Sent Events alone, since gzip would hold
+    each event back in its buffer instead of sending it right away. Decided
+    on the Content-Type of the response, whatever the client accepts.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            if "gzip" in Headers(scope=scope).get("accept-encoding", ""):
+                responder = _CompressionResponder(
+                    self.app, self.minimum_size, compresslevel=self.compresslevel
+                )
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+def add_compression_middleware(app: FastAPI):
+    app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
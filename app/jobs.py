@@ -0,0 +1,269 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple, Optional, Type
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from app.api.analytics import fetch_key_user_stats, fetch_tweet_stats
+from app.api.data_filtering import fetch_filtered_data
+from app.api.visualization_data import (
+    fetch_tweet_distribution,
+    fetch_tweet_heatmap,
+    fetch_tweet_trends,
+)
+from app.db.database import SessionLocal, read_engine_balancer
+from app.models.request.data_filtering import DataFilteringParams
+from app.models.request.jobs import (
+    FilteredDataJobParams,
+    KeyUserStatsJobParams,
+    TweetDistributionJobParams,
+    TweetHeatmapJobParams,
+    TweetStatsJobParams,
+    TweetTrendsJobParams,
+)
+
+logger = logging.getLogger(__name__)
+
+# Directory shared by the workers of a host, so that any of them can answer
+# for a job whichever worker runs it.
+JOB_RESULTS_DIR = os.environ.get(
+    "NCRI_JOB_RESULTS_DIR", os.path.join(tempfile.gettempdir(), "ncri-jobs")
+)
+# Seconds a finished job and its result are kept for
+JOB_RESULT_TTL_SECONDS = int(os.environ.get("NCRI_JOB_RESULT_TTL_SECONDS", "3600"))
+# Jobs running at the same time in a worker
+JOB_WORKERS = int(os.environ.get("NCRI_JOB_WORKERS", "2"))
+# Jobs allowed to wait for a free job worker, further submissions are refused
+JOB_QUEUE_SIZE = int(os.environ.get("NCRI_JOB_QUEUE_SIZE", "20"))
+# Seconds a job has to complete in from its submission, queueing included.
+# Bounds its queries, and tells jobs lost by a restarted worker apart.
+JOB_TIMEOUT_SECONDS = int(os.environ.get("NCRI_JOB_TIMEOUT_SECONDS", "1800"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+def _run_tweet_stats(db, params: TweetStatsJobParams):
+    # Same defaults as the endpoint, the week up to today.
+    end_date = params.end_date or datetime.now().date()
+    start_date = params.start_date or end_date - timedelta(days=7)
+    return fetch_tweet_stats(
+        db, start_date, end_date, params.page, params.page_size, params.criteria
+    )
+
+
+def _run_filtered_data(db, params: FilteredDataJobParams):
+    data_filtering_params = DataFilteringParams(
+        **params.model_dump(exclude={"page", "page_size"})
+    )
+    return fetch_filtered_data(
+        db, data_filtering_params, params.page, params.page_size
+    )
+
+
+class JobKind(NamedTuple):
+    params_model: Type[BaseModel]
+    run: Callable
+
+
+JOB_KINDS = {
+    "key_user_stats": JobKind(
+        KeyUserStatsJobParams,
+        lambda db, params: fetch_key_user_stats(db, params.page, params.page_size),
+    ),
+    "tweet_stats": JobKind(TweetStatsJobParams, _run_tweet_stats),
+    "tweet_trends": JobKind(
+        TweetTrendsJobParams,
+        lambda db, params: fetch_tweet_trends(
+            db,
+            params.metric,
+            params.time_interval,
+            params.start_date,
+            params.end_date,
+            params.page,
+            params.page_size,
+        ),
+    ),
+    "tweet_distribution": JobKind(
+        TweetDistributionJobParams,
+        lambda db, params: fetch_tweet_distribution(
+            db, params.category, params.top_n, params.page, params.page_size
+        ),
+    ),
+    "tweet_heatmap": JobKind(
+        TweetHeatmapJobParams,
+        lambda db, params: fetch_tweet_heatmap(
+            db, params.start_date, params.end_date, params.threat_level
+        ),
+    ),
+    "filtered_data": JobKind(FilteredDataJobParams, _run_filtered_data),
+}
+
+
+class JobStore:
+    """
+    Keeps the status and result of jobs as JSON files in a local directory.
+    Finished jobs expire `ttl` seconds after completing.
+    """
+
+    def __init__(self, directory: str, ttl: int):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def result_path(self, job_id: str) -> str:
+        return self._path(job_id, ".result")
+
+    def _path(self, job_id: str, suffix: str = "") -> str:
+        # Job ids are generated by us, anything else could escape the directory.
+        return os.path.join(self.directory, uuid.UUID(job_id).hex + suffix + ".json")
+
+    def _write(self, path: str, data):
+        # Write then rename, so that readers never see a partial file.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def save(self, job: dict):
+        self._write(self._path(job["id"]), job)
+
+    def save_result(self, job_id: str, result):
+        self._write(self.result_path(job_id), jsonable_encoder(result))
+
+    def get(self, job_id: str) -> Optional[dict]:
+        try:
+            with open(self._path(job_id)) as f:
+                job = json.load(f)
+        except (ValueError, FileNotFoundError):
+            return None
+        now = time.time()
+        if job["expires_at"] < now:
+            self.delete(job_id)
+            return None
+        if job["status"] in (QUEUED, RUNNING) and job["deadline"] < now:
+            # Its worker went away before finishing it, e.g. on a restart.
+            self.fail(job, "Job was interrupted, submit it again")
+        return job
+
+    def fail(self, job: dict, error: str):
+        finished_at = time.time()
+        job.update(
+            status=FAILED,
+            error=error,
+            finished_at=finished_at,
+            expires_at=finished_at + self.ttl,
+        )
+        self.save(job)
+
+    def delete(self, job_id: str):
+        for suffix in ("", ".result"):
+            try:
+                os.remove(self._path(job_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def purge_expired(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".json") and not name.endswith(".result.json"):
+                # Removes the job and its result when expired
+                self.get(name[: -len(".json")])
+
+
+class JobRunner:
+    """
+    Runs jobs on a bounded pool of threads against a read database, keeping
+    track of them in a `JobStore`.
+    """
+
+    def __init__(self, store: JobStore, workers: int, queue_size: int, timeout: int):
+        self.store = store
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="job"
+        )
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def submit(self, kind: str, params: BaseModel) -> dict:
+        if not self._slots.acquire(blocking=False):
+            raise HTTPException(
+                status_code=503,
+                detail="Too many pending jobs, try again later",
+                headers={"Retry-After": "10"},
+            )
+
+        created_at = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "params": jsonable_encoder(params),
+            "status": QUEUED,
+            "error": None,
+            "created_at": created_at,
+            "deadline": created_at + self.timeout,
+            "finished_at": None,
+            # Pushed back once the job finishes, a job lost by its worker
+            # expires nonetheless.
+            "expires_at": created_at + self.timeout + self.store.ttl,
+        }
+        self.store.save(job)
+        future = self._executor.submit(self._run, dict(job), params)
+        future.add_done_callback(lambda f: self._cancelled(dict(job), f))
+        return job
+
+    def _cancelled(self, job: dict, future):
+        # Jobs still queued when the runner shuts down never run
+        if future.cancelled():
+            self.store.fail(job, "Job was cancelled by a restart, submit it again")
+            self._slots.release()
+
+    def _run(self, job: dict, params: BaseModel):
+        try:
+            self.store.purge_expired()
+            remaining = job["deadline"] - time.time()
+            if remaining <= 0:
+                raise HTTPException(
+                    status_code=503, detail="Job waited too long to start"
+                )
+            job["status"] = RUNNING
+            self.store.save(job)
+            with SessionLocal(bind=read_engine_balancer.choose()) as db:
+                db.info["statement_timeout_ms"] = int(remaining * 1000)
+                result = JOB_KINDS[job["kind"]].run(db, params)
+            self.store.save_result(job["id"], result)
+            job["status"] = SUCCEEDED
+        except HTTPException as e:
+            job["status"], job["error"] = FAILED, e.detail
+        except Exception:
+            # The details, e.g. of a database error, stay in the logs.
+            logger.exception("Job %s failed", job["id"])
+            job["status"], job["error"] = FAILED, "Job failed"
+        finally:
+            job["finished_at"] = time.time()
+            job["expires_at"] = job["finished_at"] + self.store.ttl
+            self.store.save(job)
+            self._slots.release()
+
+    def shutdown(self):
+        # Running jobs are left to finish, but not the queued ones, so that a
+        # restart doesn't wait on the whole queue.
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+job_runner = JobRunner(
+    JobStore(JOB_RESULTS_DIR, JOB_RESULT_TTL_SECONDS),
+    JOB_WORKERS,
+    JOB_QUEUE_SIZE,
+    JOB_TIMEOUT_SECONDS,
+)
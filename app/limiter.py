@@ -1,14 +1,191 @@
-from fastapi import FastAPI
-from slowapi.errors import RateLimitExceeded
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 
-limiter = Limiter(key_func=get_remote_address)
+from fastapi import HTTPException, Request
 
+# Shared memory file holding the buckets of all the workers of a host
+RATE_LIMIT_FILE = os.environ.get(
+    "NCRI_RATE_LIMIT_FILE",
+    os.path.join(
+        "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+        "ncri-rate-limits",
+    ),
+)
+# Overrides of the limits of the routes, e.g.
+# "analytics.get_key_user_stats=20/minute;jobs.submit_job=2/minute"
+RATE_LIMITS = os.environ.get("NCRI_RATE_LIMITS", "")
 
-def add_limiter_exception_handler(app: FastAPI):
-    app.state.limiter = limiter
-    app.add_exception_handler(
-        RateLimitExceeded,
-        _rate_limit_exceeded_handler,
+# The table is split in stripes of slots, each locked on its own so that
+# workers updating different buckets don't wait on each other.
+STRIPES = 256
+SLOTS_PER_STRIPE = 32
+# Slot: hash of the bucket key (0 if free), tokens left, time of last update
+SLOT = struct.Struct("<Qdd")
+STRIPE_SIZE = SLOT.size * SLOTS_PER_STRIPE
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+LIMIT_PATTERN = re.compile(r"^\s*(\d+)\s*(?:/|per)\s*(second|minute|hour|day)s?\s*$")
+
+
+@lru_cache(maxsize=None)
+def parse_limit(limit: str) -> Tuple[int, float]:
+    """
+    Parse a limit such as "5/minute" into the capacity of its bucket and the
+    rate, in tokens per second, at which it refills.
+    """
+    match = LIMIT_PATTERN.match(limit)
+    if match is None:
+        raise ValueError(f"Invalid rate limit: {limit}")
+    capacity = int(match.group(1))
+    return capacity, capacity / PERIODS[match.group(2)]
+
+
+def _parse_overrides(overrides: str) -> Dict[str, str]:
+    limits = {}
+    for override in filter(None, (o.strip() for o in overrides.split(";"))):
+        route, _, limit = override.partition("=")
+        parse_limit(limit)
+        limits[route.strip()] = limit.strip()
+    return limits
+
+
+def _hash_key(key: str) -> int:
+    # Stable across workers, unlike hash(). 0 marks free slots.
+    return (
+        int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+        or 1
     )
+
+
+class TokenBucketStore:
+    """
+    Token buckets kept in a memory mapped file, so that all the workers of a
+    host draw from the same buckets.
+
+    A bucket is found by open addressing within the stripe its key hashes
+    to. Updates hold the stripe's lock, a `threading.Lock` between the
+    threads of a worker and a `lockf` record lock between workers. When a
+    stripe is full, the bucket updated longest ago is given up, it has
+    usually refilled by then.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < STRIPES * STRIPE_SIZE:
+            os.ftruncate(fd, STRIPES * STRIPE_SIZE)
+        self._fd = fd
+        self._map = mmap.mmap(fd, STRIPES * STRIPE_SIZE)
+        self._locks = [threading.Lock() for _ in range(STRIPES)]
+
+    def take(self, key: str, capacity: int, rate: float) -> float:
+        """
+        Take a token from the bucket of `key`. Returns 0 when one was taken,
+        otherwise the seconds until the bucket holds a token again.
+        """
+        key_hash = _hash_key(key)
+        stripe = key_hash % STRIPES
+        offset = stripe * STRIPE_SIZE
+
+        with self._locks[stripe]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, STRIPE_SIZE, offset)
+            try:
+                now = time.time()
+                slot, tokens, updated_at = self._find(key_hash, offset)
+                if slot is None:
+                    slot, tokens = self._evict(offset), capacity
+                else:
+                    elapsed = max(now - updated_at, 0)
+                    tokens = min(capacity, tokens + elapsed * rate)
+
+                if tokens >= 1:
+                    retry_after, tokens = 0, tokens - 1
+                else:
+                    retry_after = (1 - tokens) / rate
+                SLOT.pack_into(self._map, slot, key_hash, tokens, now)
+                return retry_after
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, STRIPE_SIZE, offset)
+
+    def _find(self, key_hash: int, offset: int):
+        for slot in range(offset, offset + STRIPE_SIZE, SLOT.size):
+            slot_hash, tokens, updated_at = SLOT.unpack_from(self._map, slot)
+            if slot_hash == key_hash:
+                return slot, tokens, updated_at
+            if slot_hash == 0:
+                break
+        return None, 0, 0
+
+    def _evict(self, offset: int) -> int:
+        oldest, oldest_updated_at = offset, float("inf")
+        for slot in range(offset, offset + STRIPE_SIZE, SLOT.size):
+            slot_hash, _, updated_at = SLOT.unpack_from(self._map, slot)
+            if slot_hash == 0:
+                return slot
+            if updated_at < oldest_updated_at:
+                oldest, oldest_updated_at = slot, updated_at
+        return oldest
+
+
+def get_remote_address(request: Request) -> str:
+    return request.client.host if request.client else "127.0.0.1"
+
+
+class Limiter:
+    """
+    Rate limits routes per client with token buckets shared by the workers
+    of a host.
+    """
+
+    def __init__(
+        self,
+        store: TokenBucketStore,
+        key_func=get_remote_address,
+        overrides: Optional[Dict[str, str]] = None,
+    ):
+        self.store = store
+        self.key_func = key_func
+        self.overrides = overrides or {}
+
+    def limit(self, limit: str):
+        """
+        Dependency limiting a route to `limit`, e.g. "5/minute", unless
+        overridden for the route in NCRI_RATE_LIMITS.
+
+        List it after `conditional_cache`, so that requests answered with a
+        304 don't spend a token, and before the route's admission, so that
+        requests over the limit are turned away before queueing for a slot.
+        """
+        parse_limit(limit)
+
+        async def check(request: Request):
+            endpoint = request.scope["endpoint"]
+            route = f"{endpoint.__module__.rsplit('.', 1)[-1]}.{endpoint.__name__}"
+            route_limit = self.overrides.get(route, limit)
+            capacity, rate = parse_limit(route_limit)
+
+            key = f"{route}:{self.key_func(request)}"
+            retry_after = self.store.take(key, capacity, rate)
+            if retry_after:
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Rate limit exceeded: {route_limit}",
+                    headers={"Retry-After": str(math.ceil(retry_after))},
+                )
+
+        return check
+
+
+limiter = Limiter(
+    TokenBucketStore(RATE_LIMIT_FILE), overrides=_parse_overrides(RATE_LIMITS)
+)
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+import asyncpg
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.db.database import SQLALCHEMY_DATABASE_URL
+from app.models.request.data_filtering import (
+    HATEFUL,
+    NEUTRAL,
+    NON_THREATENING,
+    THREATENING,
+)
+
+logger = logging.getLogger(__name__)
+
+TWEET_COUNTS_CHANNEL = "tweet_counts"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more.
+MAX_PAYLOAD_SIZE = 7900
+# Updates queued for a subscriber that doesn't keep up are dropped.
+SUBSCRIBER_QUEUE_SIZE = 100
+RECONNECT_DELAY_SECONDS = 5
+
+
+def content_classes(threat_level: Optional[str], hateful: Optional[str]) -> List[str]:
+    """
+    Content types a tweet counts towards, following the definitions used by
+    the data_filtering endpoint.
+    """
+    non_threatening = threat_level in ("Low", None)
+    non_hateful = hateful in ("Low", None)
+    classes = []
+    if threat_level in ("Medium", "High"):
+        classes.append(THREATENING)
+    if non_threatening:
+        classes.append(NON_THREATENING)
+    if hateful in ("Medium", "High"):
+        classes.append(HATEFUL)
+    if non_threatening and non_hateful:
+        classes.append(NEUTRAL)
+    return classes
+
+
+def count_deltas(rows: Iterable) -> Dict[str, Dict[str, int]]:
+    """
+    Aggregate `(date, threat_level, hateful)` rows of newly inserted tweets
+    into per day counts by content class.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for date, threat_level, hateful in rows:
+        day = deltas[date.isoformat() if date else "unknown"]
+        day["total"] += 1
+        for content_class in content_classes(threat_level, hateful):
+            day[content_class] += 1
+    return deltas
+
+
+def notify_tweet_counts(session: Session, deltas: Dict[str, Dict[str, int]]):
+    """
+    Queue NOTIFY events carrying `deltas` on the session's transaction. They
+    are only delivered to listeners once the transaction commits.
+    """
+    payloads = []
+    counts = {}
+    for day, day_counts in deltas.items():
+        candidate = dict(counts, **{day: day_counts})
+        if counts and len(json.dumps({"counts": candidate})) > MAX_PAYLOAD_SIZE:
+            payloads.append(json.dumps({"counts": counts}))
+            candidate = {day: day_counts}
+        counts = candidate
+    if counts:
+        payloads.append(json.dumps({"counts": counts}))
+
+    for payload in payloads:
+        session.execute(select(func.pg_notify(TWEET_COUNTS_CHANNEL, payload)))
+
+
+class TweetCountBroadcaster:
+    """
+    Fans the tweet count notifications out to the live subscribers of this
+    worker over a single LISTEN connection to the primary.
+
+    The connection is opened on the first subscription. Payloads are
+    forwarded as received, so an idle subscriber costs nothing between
+    updates.
+    """
+
+    def __init__(self, dsn: str, channel: str):
+        self.dsn = dsn
+        self.channel = channel
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._connection: Optional[asyncpg.Connection] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+
+    async def subscribe(self) -> asyncio.Queue:
+        await self._listen()
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    async def close(self):
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            await connection.close()
+
+    async def _listen(self):
+        # Created here so that it belongs to the worker's event loop.
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._connection is not None and not self._connection.is_closed():
+                return
+            connection = await asyncpg.connect(self.dsn)
+            await connection.add_listener(self.channel, self._on_notification)
+            connection.add_termination_listener(self._on_termination)
+            self._connection = connection
+
+    def _on_notification(self, connection, pid, channel, payload):
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                logger.warning("Dropping tweet count update for a slow subscriber")
+
+    def _on_termination(self, connection):
+        if connection is not self._connection:
+            return
+        self._connection = None
+        logger.warning("Lost the %s LISTEN connection", self.channel)
+        self._reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self):
+        while self._subscribers:
+            try:
+                await self._listen()
+                return
+            except (OSError, asyncpg.PostgresError):
+                await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+
+tweet_count_broadcaster = TweetCountBroadcaster(
+    SQLALCHEMY_DATABASE_URL, TWEET_COUNTS_CHANNEL
+)
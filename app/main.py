@@ -1,25 +1,41 @@
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request
+from app.admission import add_admission_exception_handler
 from app.api.analytics import analytics
 from app.api.data_filtering import data_filtering
+from app.api.jobs import jobs
+from app.api.live import live
 from app.api.visualization_data import visualization_data
-from app.limiter import add_limiter_exception_handler, limiter
+from app.http_cache import add_compression_middleware
+from app.jobs import job_runner
+from app.limiter import limiter
+from app.live import tweet_count_broadcaster
 
 
 # Create FastAPI app instance
 app = FastAPI()
 
-# Add rate limiting exception handler
-add_limiter_exception_handler(app)
+# Answer queries cancelled by their statement timeout with a 503
+add_admission_exception_handler(app)
+
+# Compress large JSON responses
+add_compression_middleware(app)
 
 # Include routers
 app.include_router(data_filtering)
 app.include_router(analytics)
 app.include_router(visualization_data)
+app.include_router(live)
+app.include_router(jobs)
+
+# Close the LISTEN connection used by the live endpoints
+app.add_event_handler("shutdown", tweet_count_broadcaster.close)
+
+# Shut down the job workers
+app.add_event_handler("shutdown", job_runner.shutdown)
 
 
 # Define root route
-@app.get("/")
-@limiter.limit("5/minute")
+@app.get("/", dependencies=[Depends(limiter.limit("5/minute"))])
 async def root(request: Request):
     """
     Root endpoint returning a simple message.
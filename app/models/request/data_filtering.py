@@ -24,6 +24,10 @@ class DataFilteringParams(BaseModel):
         "",
         description="Content type to retrieve. e.g. threatening, hateful, neutral",
     )
+    include_text: bool = Field(
+        False,
+        description="Include the full_text, text and clean_text of the tweets",
+    )
 
     # NOTE: I can add more logic to disallow day > 31
     # or let's say 30 days in month 2 (Feb)
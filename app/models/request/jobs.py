@@ -0,0 +1,85 @@
+from datetime import datetime
+from typing import Literal, Optional
+
+from pydantic import AfterValidator, BaseModel, Field
+from typing_extensions import Annotated
+
+from app.db.models.tweets import Tweet
+from app.models.request.data_filtering import (
+    HATEFUL,
+    THREATENING,
+    DataFilteringParams,
+)
+
+# Jobs aren't bound by the request timeout, so they can return (and export)
+# much larger pages than the endpoints.
+JOB_MAX_PAGE_SIZE = 100000
+
+
+def _validate_column(column: str) -> str:
+    if column not in Tweet.__table__.columns:
+        raise ValueError(f"Unknown column: {column}")
+    return column
+
+
+# Name of a column of the tweets table
+TweetColumn = Annotated[str, AfterValidator(_validate_column)]
+
+
+class JobRequest(BaseModel):
+    kind: str = Field(
+        ...,
+        description="Analysis to run. e.g. tweet_trends, tweet_distribution, filtered_data",
+    )
+    params: dict = Field(
+        default_factory=dict,
+        description="Parameters of the corresponding endpoint",
+    )
+
+
+class PaginatedJobParams(BaseModel):
+    page: int = Field(1, ge=1, description="Page number")
+    page_size: int = Field(10, ge=1, le=JOB_MAX_PAGE_SIZE, description="Page size")
+
+
+class KeyUserStatsJobParams(PaginatedJobParams):
+    pass
+
+
+class TweetStatsJobParams(PaginatedJobParams):
+    start_date: Optional[datetime] = Field(None, description="Start date")
+    end_date: Optional[datetime] = Field(None, description="End date")
+    criteria: Optional[Literal[THREATENING, HATEFUL]] = Field(
+        None, description="threatening or hateful"
+    )
+
+
+class TweetTrendsJobParams(PaginatedJobParams):
+    metric: TweetColumn = Field(
+        ..., description="The metric to analyze (e.g., author)"
+    )
+    time_interval: str = Field(..., description="The time interval (e.g., day, month)")
+    start_date: Optional[datetime] = Field(None, description="Start date for analysis")
+    end_date: Optional[datetime] = Field(None, description="End date for analysis")
+
+
+class TweetDistributionJobParams(PaginatedJobParams):
+    metric: TweetColumn = Field(
+        ..., description="The metric to analyze (e.g., follower_count)"
+    )
+    category: TweetColumn = Field(
+        ..., description="The category to group by (e.g., author, lang)"
+    )
+    top_n: Optional[int] = Field(None, description="Limit the number of results")
+
+
+class TweetHeatmapJobParams(BaseModel):
+    start_date: datetime = Field(..., description="Start date of the date range")
+    end_date: datetime = Field(..., description="End date of the date range")
+    threat_level: Optional[str] = Field(
+        None, description="Threat level to filter tweets (optional)"
+    )
+
+
+class FilteredDataJobParams(DataFilteringParams, PaginatedJobParams):
+    pass
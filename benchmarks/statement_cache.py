@@ -0,0 +1,184 @@
+"""
+Microbenchmark of the per-request CPU spent building and executing the read
+queries, comparing the previous per-request ORM query construction with the
+cached statements used by the routes.
+
+It runs against an in-memory SQLite database holding a handful of rows, so
+the timings are dominated by the Python side of each request rather than by
+the database. Run it from the repository root:
+
+    python -m benchmarks.statement_cache
+"""
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.analytics import fetch_key_user_stats, fetch_tweet_stats
+from app.api.visualization_data import (
+    fetch_tweet_distribution,
+    fetch_tweet_heatmap,
+    fetch_tweet_trends,
+)
+from app.db.database import Base
+from app.db.models.tweets import Tweet
+
+ITERATIONS = 2000
+
+START_DATE = datetime(2024, 1, 1)
+END_DATE = datetime(2024, 2, 1)
+
+
+def make_session():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+
+    @event.listens_for(engine, "connect")
+    def add_date_trunc(dbapi_connection, _):
+        # Good enough for the benchmark, only the shape of the query matters.
+        dbapi_connection.create_function(
+            "date_trunc", 2, lambda _, value: value[:10] if value else None
+        )
+
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    for i in range(50):
+        day = datetime(2024, 1, 1 + i % 28)
+        session.add(
+            Tweet(
+                id=str(i),
+                author=f"author{i % 5}",
+                created_at=day,
+                datetime=day,
+                year=day.year,
+                month=day.month,
+                day=day.day,
+                threat_level="High" if i % 3 else "Low",
+                lang="en",
+            )
+        )
+    session.commit()
+    return session
+
+
+# Query construction as the routes did it before the statements were cached.
+
+
+def orm_key_user_stats(db, page, page_size):
+    total_count = db.query(func.count(func.distinct(Tweet.author))).scalar()
+    query = (
+        db.query(Tweet.author, func.count().label("tweet_count"))
+        .group_by(Tweet.author)
+        .order_by(func.count().desc())
+        .limit(page_size)
+        .offset((page - 1) * page_size)
+    )
+    return total_count, query.all()
+
+
+def orm_tweet_stats(db, start_date, end_date, page, page_size):
+    query = (
+        db.query(
+            func.date(Tweet.created_at).label("date"),
+            func.count().label("tweet_count"),
+        )
+        .filter(Tweet.created_at >= start_date, Tweet.created_at <= end_date)
+        .group_by(func.date(Tweet.created_at))
+        .order_by(func.date(Tweet.created_at))
+        .limit(page_size)
+        .offset((page - 1) * page_size)
+    )
+    return query.all()
+
+
+def orm_tweet_trends(db, metric, time_interval, start_date, end_date, page, page_size):
+    query = db.query(
+        func.date_trunc(time_interval, Tweet.datetime).label("date"),
+        getattr(Tweet, metric).label("value"),
+        func.count().label("count"),
+    )
+    query = query.filter(Tweet.datetime >= start_date)
+    query = query.filter(Tweet.datetime <= end_date)
+    query = query.group_by("date", "value").order_by("date")
+    total_results = query.count()
+    return total_results, query.offset((page - 1) * page_size).limit(page_size).all()
+
+
+def orm_tweet_distribution(db, category, top_n, page, page_size):
+    query = db.query(getattr(Tweet, category), func.count().label("value"))
+    query = query.group_by(getattr(Tweet, category)).order_by(func.count().desc())
+    total_results = query.count()
+    return total_results, query.offset((page - 1) * page_size).limit(page_size).all()
+
+
+def orm_tweet_heatmap(db, start_date, end_date, threat_level):
+    query = db.query(Tweet.year, Tweet.month, Tweet.day)
+    query = query.filter(Tweet.threat_level == threat_level)
+    return (
+        query.filter(Tweet.datetime >= start_date, Tweet.datetime <= end_date)
+        .group_by(Tweet.year, Tweet.month, Tweet.day)
+        .order_by(Tweet.year, Tweet.month, Tweet.day)
+        .all()
+    )
+
+
+CASES = [
+    (
+        "key_user_stats",
+        lambda db: orm_key_user_stats(db, 1, 10),
+        lambda db: fetch_key_user_stats(db, 1, 10),
+    ),
+    (
+        "tweet_stats",
+        lambda db: orm_tweet_stats(db, START_DATE, END_DATE, 1, 10),
+        lambda db: fetch_tweet_stats(db, START_DATE, END_DATE, 1, 10),
+    ),
+    (
+        "tweet_trends",
+        lambda db: orm_tweet_trends(db, "author", "day", START_DATE, END_DATE, 1, 10),
+        lambda db: fetch_tweet_trends(
+            db, "author", "day", START_DATE, END_DATE, 1, 10
+        ),
+    ),
+    (
+        "tweet_distribution",
+        lambda db: orm_tweet_distribution(db, "lang", None, 1, 10),
+        lambda db: fetch_tweet_distribution(db, "lang", None, 1, 10),
+    ),
+    (
+        "tweet_heatmap",
+        lambda db: orm_tweet_heatmap(db, START_DATE, END_DATE, "High"),
+        lambda db: fetch_tweet_heatmap(db, START_DATE, END_DATE, "High"),
+    ),
+]
+
+
+def cpu_per_request(db, run):
+    # Warm up SQLAlchemy's compiled cache and the statement cache.
+    for _ in range(50):
+        run(db)
+    start = time.process_time()
+    for _ in range(ITERATIONS):
+        run(db)
+    return (time.process_time() - start) / ITERATIONS * 1e6
+
+
+def main():
+    db = make_session()
+    print(f"{'query':<20} {'before (us)':>12} {'after (us)':>12} {'speedup':>8}")
+    for name, before, after in CASES:
+        before_us = cpu_per_request(db, before)
+        after_us = cpu_per_request(db, after)
+        print(
+            f"{name:<20} {before_us:>12.1f} {after_us:>12.1f} "
+            f"{before_us / after_us:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
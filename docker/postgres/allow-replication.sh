@@ -0,0 +1,3 @@
+#!/bin/bash
+# Lets the postgres_replica service stream WAL from this instance.
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
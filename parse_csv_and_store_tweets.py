@@ -1,11 +1,16 @@
 import csv
 
+from sqlalchemy import func, update
 from sqlalchemy.dialects.postgresql import insert
 
 from app.db.database import SessionLocal
-from app.db.models.tweets import Tweet
+from app.db.models.dataset_generation import DatasetGeneration
+from app.db.models.tweets import Tweet, TweetText
+from app.live import count_deltas, notify_tweet_counts
 
 file_path = "./screener_tweets.csv"
+# Number of tweets inserted per transaction
+BATCH_SIZE = 1000
 
 
 def read_csv(filename, required_columns):
@@ -47,6 +52,7 @@ data_dict = {
 }
 
 nullable_boolean_keys = ["retweeted", "len_filter"]
+text_keys = ["full_text", "text", "clean_text"]
 tweets = read_csv(file_path, data_dict)
 
 # Hacky way to get around None valued string to be bool or Nonetype.
@@ -61,9 +67,38 @@ for tweet in tweets:
         else:
             tweet[key] = None
 
-# Do nothing because we see conflicts of duplicate tweets due to
-# inserting same pkey multiple times.
-insert_stmt = insert(Tweet).values(tweets).on_conflict_do_nothing()
+# The text columns are stored apart, in the tweet_texts table.
+tweet_texts = [
+    {"id": tweet["id"], **{key: tweet.pop(key) for key in text_keys}}
+    for tweet in tweets
+]
+
+# Bumping the generation invalidates the ETags handed out by the read
+# endpoints. It's committed together with the tweets.
+bump_generation_stmt = update(DatasetGeneration).values(
+    generation=DatasetGeneration.generation + 1,
+    updated_at=func.now(),
+)
+
+# Each batch is committed on its own, so that live subscribers are notified
+# of the new tweet counts as they're stored.
 with SessionLocal() as session:
-    session.execute(insert_stmt)
-    session.commit()
+    for start in range(0, len(tweets), BATCH_SIZE):
+        end = start + BATCH_SIZE
+        # Do nothing because we see conflicts of duplicate tweets due to
+        # inserting same pkey multiple times.
+        insert_stmt = (
+            insert(Tweet)
+            .values(tweets[start:end])
+            .on_conflict_do_nothing()
+            .returning(func.date(Tweet.created_at), Tweet.threat_level, Tweet.hateful)
+        )
+        inserted = session.execute(insert_stmt).all()
+        insert_texts_stmt = (
+            insert(TweetText).values(tweet_texts[start:end]).on_conflict_do_nothing()
+        )
+        session.execute(insert_texts_stmt)
+        if inserted:
+            session.execute(bump_generation_stmt)
+            notify_tweet_counts(session, count_deltas(inserted))
+        session.commit()
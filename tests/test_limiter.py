@@ -0,0 +1,91 @@
+import multiprocessing
+from types import SimpleNamespace
+
+import pytest
+
+import app.limiter as limiter_module
+from app.limiter import (
+    SLOTS_PER_STRIPE,
+    STRIPES,
+    TokenBucketStore,
+    _hash_key,
+    parse_limit,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(limiter_module, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TokenBucketStore(str(tmp_path / "buckets"))
+
+
+def test_parse_limit():
+    assert parse_limit("5/minute") == (5, 5 / 60)
+    assert parse_limit("10 per second") == (10, 10)
+    with pytest.raises(ValueError):
+        parse_limit("5/fortnight")
+
+
+def test_take_until_empty_then_refill(store, clock):
+    assert [store.take("client", 3, 1.0) for _ in range(3)] == [0, 0, 0]
+    assert store.take("client", 3, 1.0) == pytest.approx(1.0)
+
+    clock.now += 0.5
+    assert store.take("client", 3, 1.0) == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert store.take("client", 3, 1.0) == 0
+    assert store.take("client", 3, 1.0) > 0
+
+
+def test_refill_is_capped_at_capacity(store, clock):
+    store.take("client", 2, 1.0)
+    clock.now += 3600
+    assert [store.take("client", 2, 1.0) for _ in range(2)] == [0, 0]
+    assert store.take("client", 2, 1.0) > 0
+
+
+def test_buckets_are_per_key(store, clock):
+    assert store.take("a", 1, 0.001) == 0
+    assert store.take("a", 1, 0.001) > 0
+    assert store.take("b", 1, 0.001) == 0
+
+
+def test_full_stripe_evicts_the_least_recently_updated_bucket(store, clock):
+    keys = []
+    i = 0
+    while len(keys) < SLOTS_PER_STRIPE + 1:
+        key = f"client-{i}"
+        if _hash_key(key) % STRIPES == 0:
+            keys.append(key)
+        i += 1
+
+    for key in keys[:SLOTS_PER_STRIPE]:
+        clock.now += 1
+        assert store.take(key, 1, 0.0001) == 0
+
+    # Takes the slot of keys[0], the least recently updated one.
+    clock.now += 1
+    assert store.take(keys[-1], 1, 0.0001) == 0
+
+    # keys[0] starts over with a full bucket, the others are kept.
+    assert store.take(keys[0], 1, 0.0001) == 0
+    assert store.take(keys[2], 1, 0.0001) > 0
+
+
+def _take_all(path, attempts):
+    store = TokenBucketStore(path)
+    return sum(1 for _ in range(attempts) if store.take("shared", 100, 0.0001) == 0)
+
+
+def test_buckets_are_shared_across_processes(tmp_path):
+    path = str(tmp_path / "buckets")
+    with multiprocessing.Pool(6) as pool:
+        granted = pool.starmap(_take_all, [(path, 50)] * 6)
+    assert sum(granted) == 100